@@ -0,0 +1,256 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+古腾堡转Markdown转换器性能基准测试
+使用可按大小生成的合成古腾堡文章语料，测量 convert_to_markdown 及各转换步骤的吞吐量和峰值内存，
+并与保存的基线对比，性能退化超过阈值时返回非零退出码
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+from convert_gutenberg_to_markdown import GutenbergToMarkdown
+
+# 语料大小（字节）
+DEFAULT_SIZES = [1024, 10 * 1024, 100 * 1024, 1024 * 1024, 5 * 1024 * 1024]
+
+# 每个大小级别的总语料量上限，小文章会生成多篇
+CORPUS_BYTES_PER_SIZE = 5 * 1024 * 1024
+MAX_POSTS_PER_SIZE = 200
+
+# convert_to_markdown 中依次执行的转换步骤
+CONVERT_STEPS = [
+    'convert_code_block',
+    'convert_heading',
+    'convert_list',
+    'convert_quote',
+    'convert_image',
+    'convert_separator',
+    'convert_paragraph',
+    'clean_html_tags',
+]
+
+DEFAULT_BASELINE_FILE = 'benchmark_baseline.json'
+
+CODE_SAMPLES = [
+    ('bash', 'sudo apt update\nsudo apt install -y nginx &amp;&amp; systemctl restart nginx'),
+    ('python', 'def main():\n    for i in range(10):\n        print(f"{i} &lt; 10")'),
+    ('php', '&lt;?php\nadd_filter(\'rest_endpoints\', function ($endpoints) {\n    return $endpoints;\n});'),
+    ('', '// language: javascript\nconst x = [1, 2, 3].map(n =&gt; n * 2);'),
+]
+
+WORDS = ['WordPress', 'Typecho', '迁移', '服务器', '配置', 'Nginx', '数据库', '缓存', 'Markdown', '插件']
+
+
+def _sentence(rng, words=12):
+    """生成一段带行内标签的文字"""
+    parts = []
+    for _ in range(words):
+        word = rng.choice(WORDS)
+        roll = rng.random()
+        if roll < 0.08:
+            word = f'<strong>{word}</strong>'
+        elif roll < 0.14:
+            word = f'<em>{word}</em>'
+        elif roll < 0.18:
+            word = f'<code>{word.lower()}</code>'
+        elif roll < 0.21:
+            word = f'<a href="https://example.com/{word.lower()}/">{word}</a>'
+        parts.append(word)
+    return ' '.join(parts)
+
+
+def _block(rng, index):
+    """随机生成一个古腾堡块"""
+    kind = rng.choice(['paragraph', 'paragraph', 'paragraph', 'heading', 'code', 'list', 'nested_list',
+                       'quote', 'image', 'separator'])
+    if kind == 'heading':
+        level = rng.randint(2, 4)
+        return (f'<!-- wp:heading {{"level":{level}}} -->\n'
+                f'<h{level} class="wp-block-heading">{_sentence(rng, 4)}</h{level}>\n'
+                f'<!-- /wp:heading -->')
+    if kind == 'code':
+        language, code = rng.choice(CODE_SAMPLES)
+        meta = f' {{"language":"{language}"}}' if language else ''
+        return (f'<!-- wp:code{meta} -->\n'
+                f'<pre class="wp-block-code"><code>{code}</code></pre>\n'
+                f'<!-- /wp:code -->')
+    if kind == 'list':
+        ordered = rng.random() < 0.5
+        tag, meta = ('ol', ' {"ordered":true}') if ordered else ('ul', '')
+        items = ''.join(f'<li>{_sentence(rng, 5)}</li>' for _ in range(rng.randint(2, 6)))
+        return f'<!-- wp:list{meta} -->\n<{tag}>{items}</{tag}>\n<!-- /wp:list -->'
+    if kind == 'nested_list':
+        inner = ''.join(
+            f'<!-- wp:list-item --><li>{_sentence(rng, 3)}</li><!-- /wp:list-item -->' for _ in range(2)
+        )
+        return (f'<!-- wp:list -->\n<ul><!-- wp:list-item --><li>{_sentence(rng, 3)}'
+                f'<!-- wp:list --><ul>{inner}</ul><!-- /wp:list --></li><!-- /wp:list-item --></ul>\n'
+                f'<!-- /wp:list -->')
+    if kind == 'quote':
+        return (f'<!-- wp:quote -->\n<blockquote class="wp-block-quote"><p>{_sentence(rng)}</p>'
+                f'<cite>{rng.choice(WORDS)}</cite></blockquote>\n<!-- /wp:quote -->')
+    if kind == 'image':
+        width, height = rng.choice([(300, 200), (1024, 768), (150, 150)])
+        return (f'<!-- wp:image {{"id":{index},"sizeSlug":"large"}} -->\n'
+                f'<figure class="wp-block-image size-large">'
+                f'<img src="https://example.com/wp-content/uploads/2020/05/photo-{index}-{width}x{height}.jpg" '
+                f'alt="{rng.choice(WORDS)}" class="wp-image-{index}"/></figure>\n<!-- /wp:image -->')
+    if kind == 'separator':
+        return ('<!-- wp:separator -->\n<hr class="wp-block-separator has-alpha-channel-opacity"/>\n'
+                '<!-- /wp:separator -->')
+    return f'<!-- wp:paragraph -->\n<p>{_sentence(rng)}</p>\n<!-- /wp:paragraph -->'
+
+
+def build_post(target_bytes, seed):
+    """生成一篇约 target_bytes 字节（UTF-8）的古腾堡文章，相同参数结果相同"""
+    rng = random.Random(seed)
+    blocks = []
+    size = 0
+    while size < target_bytes:
+        block = _block(rng, len(blocks))
+        blocks.append(block)
+        size += len(block.encode('utf-8')) + 2
+    return '\n\n'.join(blocks)
+
+
+def build_corpus(size):
+    """生成某个大小级别的语料"""
+    count = max(1, min(MAX_POSTS_PER_SIZE, CORPUS_BYTES_PER_SIZE // size))
+    return [build_post(size, seed=size * 1000 + i) for i in range(count)]
+
+
+def _time_call(func, inputs, repeat):
+    """多次执行取最短耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for content in inputs:
+            func(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def _peak_memory(func, inputs):
+    """单独执行一次并记录峰值内存（字节），tracemalloc 会拖慢执行，不与计时混用"""
+    tracemalloc.start()
+    try:
+        for content in inputs:
+            func(content)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def _measure(func, inputs, repeat):
+    total_bytes = sum(len(content.encode('utf-8')) for content in inputs)
+    elapsed = max(_time_call(func, inputs, repeat), 1e-9)
+    return {
+        'posts_per_sec': len(inputs) / elapsed,
+        'mb_per_sec': total_bytes / 1024 / 1024 / elapsed,
+        'peak_memory': _peak_memory(func, inputs),
+    }
+
+
+def run_benchmark(sizes, repeat):
+    """对每个大小级别测量 convert_to_markdown 和每个转换步骤"""
+    converter = GutenbergToMarkdown()
+    results = {}
+
+    for size in sizes:
+        corpus = build_corpus(size)
+        size_results = {'convert_to_markdown': _measure(converter.convert_to_markdown, corpus, repeat)}
+
+        # 每个步骤的输入是上一步的输出，与 convert_to_markdown 中的顺序一致
+        step_inputs = corpus
+        for step in CONVERT_STEPS:
+            func = getattr(converter, step)
+            size_results[step] = _measure(func, step_inputs, repeat)
+            step_inputs = [func(content) for content in step_inputs]
+
+        results[str(size)] = size_results
+    return results
+
+
+def _format_size(size):
+    size = int(size)
+    if size >= 1024 * 1024:
+        return f"{size // (1024 * 1024)}MB"
+    return f"{size // 1024}KB"
+
+
+def print_results(results):
+    print("=" * 88)
+    print(f"{'大小':<8}{'步骤':<24}{'篇/秒':>14}{'MB/秒':>14}{'峰值内存(KB)':>16}")
+    print("-" * 88)
+    for size, size_results in results.items():
+        for step, stats in size_results.items():
+            print(f"{_format_size(size):<8}{step:<24}{stats['posts_per_sec']:>14.1f}"
+                  f"{stats['mb_per_sec']:>14.2f}{stats['peak_memory'] / 1024:>16.1f}")
+        print("-" * 88)
+
+
+def compare_with_baseline(results, baseline, threshold):
+    """返回超出阈值的退化项：吞吐量下降或峰值内存上升超过 threshold"""
+    regressions = []
+    for size, size_results in results.items():
+        for step, stats in size_results.items():
+            base = baseline.get(size, {}).get(step)
+            if not base:
+                continue
+            if stats['mb_per_sec'] < base['mb_per_sec'] * (1 - threshold):
+                regressions.append(f"{_format_size(size)} {step}: 吞吐量 {base['mb_per_sec']:.2f} -> "
+                                   f"{stats['mb_per_sec']:.2f} MB/秒")
+            if stats['peak_memory'] > base['peak_memory'] * (1 + threshold):
+                regressions.append(f"{_format_size(size)} {step}: 峰值内存 {base['peak_memory'] / 1024:.1f} -> "
+                                   f"{stats['peak_memory'] / 1024:.1f} KB")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='古腾堡转Markdown转换器性能基准测试')
+    parser.add_argument('--sizes', type=int, nargs='+', default=DEFAULT_SIZES,
+                        help='文章大小（字节），默认 1KB 10KB 100KB 1MB 5MB')
+    parser.add_argument('--repeat', type=int, default=3, help='每项重复次数，取最快一次 (默认: 3)')
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE_FILE,
+                        help=f'基线文件路径 (默认: {DEFAULT_BASELINE_FILE})')
+    parser.add_argument('--save-baseline', action='store_true', help='将本次结果保存为基线')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='允许的退化比例，超过则返回非零退出码 (默认: 0.2)')
+    args = parser.parse_args()
+
+    results = run_benchmark(args.sizes, args.repeat)
+    print_results(results)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"✓ 基线已保存: {args.baseline}")
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"未找到基线文件 {args.baseline}，使用 --save-baseline 生成")
+        return 0
+
+    with open(args.baseline, 'r', encoding='utf-8') as f:
+        baseline = json.load(f)
+
+    regressions = compare_with_baseline(results, baseline, args.threshold)
+    if regressions:
+        print(f"✗ 发现 {len(regressions)} 项性能退化（阈值 {args.threshold:.0%}）:")
+        for regression in regressions:
+            print(f"  {regression}")
+        return 1
+
+    print(f"✓ 与基线相比未发现超过 {args.threshold:.0%} 的性能退化")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
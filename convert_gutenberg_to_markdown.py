@@ -4,17 +4,33 @@
 将WordPress古腾堡编辑器内容转换为Markdown格式
 """
 
-import pymysql
+import collections
 import re
 import json
 import os
+import signal
+import sqlite3
+import sys
+import tempfile
+import threading
 import time
 import hashlib
+import heapq
+import multiprocessing
 import urllib.request
 import urllib.parse
+import xml.etree.ElementTree as ET
 from datetime import datetime
 from html import unescape
 
+try:
+    import pymysql
+except ImportError:  # 离线转换（offline 模式）不需要数据库
+    pymysql = None
+
+# 可选：WordPress数据库配置，用于读取图片的 _wp_attachment_metadata
+WORDPRESS_CONFIG = None
+
 TYPECHO_CONFIG = {
     'host': 'localhost',
     'port': 3306,
@@ -24,16 +40,57 @@ TYPECHO_CONFIG = {
     'charset': 'utf8mb4'
 }
 
+# 转换配置
+CONVERT_CONFIG = {
+    'image_index_file': 'usr/uploads/.image_index.json',  # 图片内容索引（相对Typecho根目录）
+    'download_chunk_size': 64 * 1024,  # 下载分块大小（字节）
+    'max_image_size': 20 * 1024 * 1024,  # 单张图片大小上限（字节）
+    'local_uploads_dir': None,  # 本地WordPress uploads目录，如 '/var/www/wordpress/wp-content/uploads'
+    'local_uploads_hardlink': True,  # 同一文件系统时使用硬链接代替复制
+    'conversion_cache_file': '.conversion_cache.sqlite',  # 转换结果缓存，设为None禁用
+    'bulk_update': False,  # 批量模式：通过临时表 + UPDATE ... JOIN 批量写回转换结果
+    'bulk_update_batch_size': 500,  # 批量模式下每批文章数
+    'track_state': True,  # 用 typecho_convert_state 表记录已处理文章，只处理新增或修改过的文章
+    'post_cpu_budget': 10,  # 单篇文章转换的CPU时间上限（秒），超时保留原文，设为0禁用
+    'profile': False,  # 统计每个转换规则的耗时、调用次数、匹配次数和输入输出字节数
+    'profile_slowest': 5,  # 每个规则记录耗时最长的文章数
+    'profile_output': None,  # 规则统计导出的JSON文件路径，None 表示只打印
+}
+
+# 转换规则版本，修改任何 convert_* 规则后需要递增，使旧的转换缓存失效
+CONVERTER_RULES_VERSION = 2
+
+class ConversionTimeout(Exception):
+    """单篇文章转换超出CPU时间预算"""
+
 class GutenbergToMarkdown:
     def __init__(self):
         self.conn = None
         self.converted_count = 0
         self.skipped_count = 0
         self.downloaded_images = {}  # 缓存已下载的图片 {原始URL: 新URL}
+        self.content_index = {}  # 图片内容索引 {SHA-256: 图片信息}
+        self.dedup_count = 0  # 内容重复而复用的图片数
+        self.attachment_paths = set()  # 已有附件路径索引
+        self.pending_attachments = []  # 待批量插入的附件记录
+        self.variant_map = {}  # 尺寸版本相对路径 -> 原图相对路径
+        self.missing_originals = set()  # 下载失败的原图URL
+        self.variant_count = 0  # 使用原图替代的尺寸版本数
+        self.cache_conn = None  # 转换结果缓存
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.timeout_cids = []  # 超出CPU时间预算的文章
+        self.pending_updates = []  # 批量模式下待更新的 (cid, text)
+        self.pending_states = []  # 待写入状态表的 (cid, 内容哈希, 时间)
+        self.profile_stats = {}  # 各转换规则的统计 {规则名: {...}}
+        self.rule_matches = 0  # 当前规则的匹配次数
+        self.current_cid = None  # 正在转换的文章
         self.typecho_root = '/var/www/typecho'  # Typecho根目录
         
     def connect_db(self):
         """连接数据库"""
+        if pymysql is None:
+            raise RuntimeError("需要安装 pymysql: pip3 install pymysql")
         self.conn = pymysql.connect(**TYPECHO_CONFIG)
         print("✓ 数据库连接成功\n")
     
@@ -41,6 +98,70 @@ class GutenbergToMarkdown:
         """关闭数据库"""
         if self.conn:
             self.conn.close()
+        self.close_conversion_cache()
+    
+    def open_conversion_cache(self):
+        """打开转换结果缓存（SQLite）"""
+        cache_file = CONVERT_CONFIG['conversion_cache_file']
+        if not cache_file or self.cache_conn:
+            return
+        
+        self.cache_conn = sqlite3.connect(cache_file)
+        self.cache_conn.execute(
+            "CREATE TABLE IF NOT EXISTS conversions (key TEXT PRIMARY KEY, result TEXT NOT NULL)"
+        )
+    
+    def close_conversion_cache(self):
+        """提交并关闭转换结果缓存"""
+        if self.cache_conn:
+            self.cache_conn.commit()
+            self.cache_conn.close()
+            self.cache_conn = None
+    
+    def convert_with_cache(self, content, cid=None):
+        """带缓存的 convert_to_markdown，缓存键为 规则版本 + 内容SHA-256"""
+        # 统计规则时不读取缓存，否则命中缓存的文章不会经过转换规则，统计结果不完整
+        if not self.cache_conn or not content or CONVERT_CONFIG['profile']:
+            return self.convert_with_budget(content, cid)
+        
+        key = hashlib.sha256(f"{CONVERTER_RULES_VERSION}\0{content}".encode('utf-8')).hexdigest()
+        row = self.cache_conn.execute("SELECT result FROM conversions WHERE key = ?", (key,)).fetchone()
+        if row:
+            self.cache_hits += 1
+            return row[0]
+        
+        self.cache_misses += 1
+        result = self.convert_with_budget(content, cid)
+        # 超时的文章不缓存，规则改进后可以重新尝试
+        if cid not in self.timeout_cids:
+            self.cache_conn.execute("INSERT OR REPLACE INTO conversions (key, result) VALUES (?, ?)", (key, result))
+        return result
+    
+    def convert_with_budget(self, content, cid=None):
+        """在CPU时间预算内执行 convert_to_markdown，超时则保留原文并记录cid"""
+        self.current_cid = cid
+        budget = CONVERT_CONFIG['post_cpu_budget']
+        # 依赖 SIGPROF 定时器，只能在类Unix系统的主线程中使用
+        if (not budget or not hasattr(signal, 'setitimer')
+                or threading.current_thread() is not threading.main_thread()):
+            return self.convert_to_markdown(content)
+        
+        def on_timeout(signum, frame):
+            raise ConversionTimeout()
+        
+        previous_handler = signal.signal(signal.SIGPROF, on_timeout)
+        try:
+            signal.setitimer(signal.ITIMER_PROF, budget)
+            try:
+                return self.convert_to_markdown(content)
+            finally:
+                signal.setitimer(signal.ITIMER_PROF, 0)
+        except ConversionTimeout:
+            print(f"  ✗ 转换超时 (cid={cid}，超过 {budget} 秒CPU时间)，保留原文")
+            self.timeout_cids.append(cid)
+            return content
+        finally:
+            signal.signal(signal.SIGPROF, previous_handler)
     
     def extract_language_from_comment(self, comment):
         """从WordPress注释中提取代码语言"""
@@ -68,14 +189,113 @@ class GutenbergToMarkdown:
         
         return '', code_content
     
+    def replace_blocks(self, content, block_name, body_pattern, replace):
+        """替换 <!-- wp:block_name {...} --> ... <!-- /wp:block_name --> 块
+        
+        body_pattern 需完整匹配开始注释与结束注释之间的内容，replace(attrs, body_match)
+        返回替换文本，返回None时保留原文。每次查找都从上一个结束注释之后开始，
+        整体耗时与内容长度成线性关系。
+        """
+        opener = re.compile(r'<!--\s*wp:' + block_name + r'(?![\w-])\s*(\{[^<>]*\})?\s*/?-->')
+        closer = re.compile(r'<!--\s*/wp:' + block_name + r'\s*-->')
+        body_regex = re.compile(body_pattern, re.DOTALL)
+        
+        result = []
+        pos = 0  # 已输出到的位置
+        search_from = 0  # 下一次查找开始注释的位置
+        while True:
+            open_match = opener.search(content, search_from)
+            if not open_match:
+                break
+            close_match = closer.search(content, open_match.end())
+            if not close_match:
+                break
+            
+            body_match = body_regex.fullmatch(content, open_match.end(), close_match.start())
+            replacement = replace(open_match.group(1), body_match) if body_match else None
+            if replacement is not None:
+                result.append(content[pos:open_match.start()])
+                result.append(replacement)
+                pos = close_match.end()
+                self.rule_matches += 1
+            search_from = close_match.end()
+        
+        result.append(content[pos:])
+        return ''.join(result)
+    
+    def rule_sub(self, pattern, repl, content):
+        """re.sub，并累计当前规则的匹配次数"""
+        content, count = re.subn(pattern, repl, content)
+        self.rule_matches += count
+        return content
+    
+    def run_rule(self, name, rule, content):
+        """执行一个转换规则，开启 profile 时记录耗时、调用次数、匹配次数和输入输出字节数"""
+        if not CONVERT_CONFIG['profile']:
+            return rule(content)
+        
+        self.rule_matches = 0
+        start = time.perf_counter()
+        result = rule(content)
+        elapsed = time.perf_counter() - start
+        
+        stats = self.profile_stats.setdefault(name, {
+            'time': 0.0, 'calls': 0, 'matches': 0, 'bytes_in': 0, 'bytes_out': 0, 'slowest': []
+        })
+        stats['time'] += elapsed
+        stats['calls'] += 1
+        stats['matches'] += self.rule_matches
+        stats['bytes_in'] += len(content.encode('utf-8'))
+        stats['bytes_out'] += len(result.encode('utf-8'))
+        
+        # 最小堆保留耗时最长的若干篇文章
+        heapq.heappush(stats['slowest'], (elapsed, self.current_cid))
+        if len(stats['slowest']) > CONVERT_CONFIG['profile_slowest']:
+            heapq.heappop(stats['slowest'])
+        
+        return result
+    
+    def report_profile(self):
+        """打印各转换规则的统计，并按配置导出JSON"""
+        if not self.profile_stats:
+            return
+        
+        report = {}
+        for name, stats in self.profile_stats.items():
+            report[name] = dict(stats, slowest=[
+                {'cid': cid, 'time': elapsed} for elapsed, cid in sorted(stats['slowest'], reverse=True)
+            ])
+        
+        print(f"{'规则':<22}{'耗时(秒)':>10}{'调用':>8}{'匹配':>10}{'输入(KB)':>12}{'输出(KB)':>12}  最慢的cid")
+        for name, stats in sorted(report.items(), key=lambda item: item[1]['time'], reverse=True):
+            slowest = ', '.join(str(entry['cid']) for entry in stats['slowest'])
+            print(f"{name:<22}{stats['time']:>10.3f}{stats['calls']:>8}{stats['matches']:>10}"
+                  f"{stats['bytes_in'] / 1024:>12.1f}{stats['bytes_out'] / 1024:>12.1f}  {slowest}")
+        
+        output_file = CONVERT_CONFIG['profile_output']
+        if output_file:
+            with open(output_file, 'w', encoding='utf-8') as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+            print(f"✓ 规则统计已导出: {output_file}")
+    
+    def strip_tags(self, html_text):
+        """移除HTML标签"""
+        return re.sub(r'<[^<>]+>', '', html_text)
+    
+    def inline_tag_pattern(self, tag, with_attrs=False, multiline=False):
+        """生成 <tag>内容</tag> 的正则，内容不跨越同名标签，保证线性时间"""
+        stop = '<' if multiline else '<\\n'
+        open_tag = f'<{tag}[^<>]*>' if with_attrs else f'<{tag}>'
+        return f'{open_tag}([^{stop}]*(?:<(?!/?{tag}\\b)[^{stop}]*)*)</{tag}>'
+    
     def convert_code_block(self, content):
         """转换代码块"""
-        # 匹配 <!-- wp:code --> ... <!-- /wp:code -->
-        pattern = r'<!--\s*wp:code\s*({[^}]*})?\s*-->\s*<pre[^>]*><code[^>]*>(.*?)</code></pre>\s*<!--\s*/wp:code\s*-->'
+        # 匹配 <!-- wp:code --> <pre><code>...</code></pre> <!-- /wp:code -->
+        body_pattern = r'\s*<pre[^<>]*><code[^<>]*>(.*)</code></pre>\s*'
         
-        def replace_code(match):
-            metadata = match.group(1) or '{}'
-            code_content = match.group(2)
+        def replace_code(attrs, match):
+            metadata = attrs or '{}'
+            code_content = match.group(1)
             
             # 提取语言
             language = ''
@@ -112,123 +332,391 @@ class GutenbergToMarkdown:
             # 构建markdown代码块
             return f'```{language}\n{code_content}\n```'
         
-        content = re.sub(pattern, replace_code, content, flags=re.DOTALL)
-        return content
+        return self.replace_blocks(content, 'code', body_pattern, replace_code)
     
     def convert_paragraph(self, content):
         """转换段落"""
         # 移除 <!-- wp:paragraph --> 注释
-        content = re.sub(r'<!--\s*wp:paragraph\s*-->\s*', '', content)
-        content = re.sub(r'\s*<!--\s*/wp:paragraph\s*-->', '', content)
+        content = self.rule_sub(r'<!--\s*wp:paragraph\s*-->\s*', '', content)
+        # (?<!\s) 保证只从空白的起始位置尝试匹配，避免长空白串上的二次方回溯
+        content = self.rule_sub(r'(?<!\s)\s*<!--\s*/wp:paragraph\s*-->', '', content)
         return content
     
     def convert_heading(self, content):
         """转换标题"""
         # 1. 转换带有 wp:heading 注释的标题
         # <!-- wp:heading {"level":2} --> <h2>...</h2> <!-- /wp:heading -->
-        pattern = r'<!--\s*wp:heading\s*({[^}]*})?\s*-->\s*<h(\d)[^>]*>(.*?)</h\2>\s*<!--\s*/wp:heading\s*-->'
-        
-        def replace_heading(match):
-            level = int(match.group(2))
-            title = match.group(3)
-            title = re.sub(r'<[^>]+>', '', title)  # 移除HTML标签
+        def replace_heading(attrs, match):
+            level = int(match.group(1))
+            title = self.strip_tags(match.group(2))  # 移除HTML标签
             return '#' * level + ' ' + title + '\n'
         
-        content = re.sub(pattern, replace_heading, content, flags=re.DOTALL)
+        content = self.replace_blocks(content, 'heading', r'\s*<h(\d)[^<>]*>(.*)</h\1>\s*', replace_heading)
         
         # 2. 转换没有注释包裹但带有 wp-block-heading 类的标题
         # <h3 class="wp-block-heading">...</h3>
-        pattern2 = r'<h(\d)[^>]*class="[^"]*wp-block-heading[^"]*"[^>]*>(.*?)</h\1>'
-        
-        def replace_standalone_heading(match):
-            level = int(match.group(1))
-            title = match.group(2)
-            title = re.sub(r'<[^>]+>', '', title)  # 移除HTML标签
-            return '\n' + '#' * level + ' ' + title + '\n'
-        
-        content = re.sub(pattern2, replace_standalone_heading, content, flags=re.DOTALL)
+        result = []
+        pos = 0
+        next_close = {}  # 各级标题下一个结束标签的位置，-1表示后面没有
+        for match in re.finditer(r'<h(\d)([^<>]*)>', content):
+            if match.start() < pos or not re.search(r'class="[^"]*wp-block-heading', match.group(2)):
+                continue
+            
+            level = match.group(1)
+            close_pos = next_close.get(level)
+            if close_pos is None or (close_pos != -1 and close_pos < match.end()):
+                close_pos = content.find(f'</h{level}>', match.end())
+                next_close[level] = close_pos
+            if close_pos == -1:
+                continue
+            
+            title = self.strip_tags(content[match.end():close_pos])  # 移除HTML标签
+            result.append(content[pos:match.start()])
+            result.append('\n' + '#' * int(level) + ' ' + title + '\n')
+            pos = close_pos + len(f'</h{level}>')
+            self.rule_matches += 1
         
-        return content
+        result.append(content[pos:])
+        return ''.join(result)
+    
+    def extract_list_items(self, list_content):
+        """提取 <li> 项，按 </li> 切分后逐段查找开始标签，保证线性时间"""
+        items = []
+        for part in list_content.split('</li>')[:-1]:
+            li_match = re.search(r'<li[^<>]*>', part)
+            if li_match:
+                items.append(self.strip_tags(part[li_match.end():]).strip())
+        return items
     
     def convert_list(self, content):
         """转换列表"""
-        # 有序列表
-        # <!-- wp:list {"ordered":true} --> <ol>...</ol> <!-- /wp:list -->
-        pattern = r'<!--\s*wp:list\s*({[^}]*})?\s*-->\s*<ol[^>]*>(.*?)</ol>\s*<!--\s*/wp:list\s*-->'
-        
-        def replace_ordered_list(match):
-            list_content = match.group(2)
-            # 提取li项
-            items = re.findall(r'<li[^>]*>(.*?)</li>', list_content, re.DOTALL)
-            result = []
-            for i, item in enumerate(items, 1):
-                item = re.sub(r'<[^>]+>', '', item).strip()
-                result.append(f'{i}. {item}')
-            return '\n'.join(result) + '\n'
-        
-        content = re.sub(pattern, replace_ordered_list, content, flags=re.DOTALL)
-        
-        # 无序列表
-        pattern = r'<!--\s*wp:list\s*-->\s*<ul[^>]*>(.*?)</ul>\s*<!--\s*/wp:list\s*-->'
-        
-        def replace_unordered_list(match):
-            list_content = match.group(1)
-            items = re.findall(r'<li[^>]*>(.*?)</li>', list_content, re.DOTALL)
-            result = []
-            for item in items:
-                item = re.sub(r'<[^>]+>', '', item).strip()
-                result.append(f'- {item}')
+        # 有序列表 <!-- wp:list {"ordered":true} --> <ol>...</ol> <!-- /wp:list -->
+        # 无序列表 <!-- wp:list --> <ul>...</ul> <!-- /wp:list -->
+        def replace_list(attrs, match):
+            items = self.extract_list_items(match.group(2))
+            if match.group(1) == 'ol':
+                result = [f'{i}. {item}' for i, item in enumerate(items, 1)]
+            else:
+                result = [f'- {item}' for item in items]
             return '\n'.join(result) + '\n'
         
-        content = re.sub(pattern, replace_unordered_list, content, flags=re.DOTALL)
-        return content
+        return self.replace_blocks(content, 'list', r'\s*<(ol|ul)[^<>]*>(.*)</\1>\s*', replace_list)
     
     def convert_quote(self, content):
         """转换引用块"""
         # <!-- wp:quote --> <blockquote>...</blockquote> <!-- /wp:quote -->
-        pattern = r'<!--\s*wp:quote\s*-->\s*<blockquote[^>]*>(.*?)</blockquote>\s*<!--\s*/wp:quote\s*-->'
-        
-        def replace_quote(match):
+        def replace_quote(attrs, match):
             quote_content = match.group(1)
             # 移除p标签
-            quote_content = re.sub(r'</?p[^>]*>', '', quote_content)
-            quote_content = re.sub(r'<[^>]+>', '', quote_content).strip()
+            quote_content = re.sub(r'</?p[^<>]*>', '', quote_content)
+            quote_content = self.strip_tags(quote_content).strip()
             lines = quote_content.split('\n')
             return '\n'.join(f'> {line}' for line in lines if line.strip()) + '\n'
         
-        content = re.sub(pattern, replace_quote, content, flags=re.DOTALL)
-        return content
+        return self.replace_blocks(content, 'quote', r'\s*<blockquote[^<>]*>(.*)</blockquote>\s*', replace_quote)
     
     def convert_image(self, content):
         """转换图片"""
         # <!-- wp:image --> <figure><img src="..." alt="..." /></figure> <!-- /wp:image -->
-        pattern = r'<!--\s*wp:image[^>]*-->\s*<figure[^>]*>.*?<img[^>]*src="([^"]+)"[^>]*alt="([^"]*)"[^>]*>.*?</figure>\s*<!--\s*/wp:image\s*-->'
-        
-        def replace_image(match):
-            src = match.group(1)
-            alt = match.group(2) or ''
-            return f'![{alt}]({src})\n'
+        def replace_image(attrs, match):
+            img_match = re.search(r'<img[^<>]*>', match.group(1))
+            if not img_match:
+                return None
+            src_match = re.search(r'\ssrc="([^"<>]+)"', img_match.group(0))
+            if not src_match:
+                return None
+            alt_match = re.search(r'\salt="([^"<>]*)"', img_match.group(0))
+            alt = alt_match.group(1) if alt_match else ''
+            return f'![{alt}]({src_match.group(1)})\n'
         
-        content = re.sub(pattern, replace_image, content, flags=re.DOTALL)
-        return content
+        return self.replace_blocks(content, 'image', r'\s*<figure[^<>]*>(.*)</figure>\s*', replace_image)
     
     def convert_separator(self, content):
         """转换分隔线"""
         # <!-- wp:separator --> <hr /> <!-- /wp:separator -->
-        # 或者 <hr class="wp-block-separator" />
-        # 匹配多种分隔线格式
-        patterns = [
-            r'<!--\s*wp:separator[^>]*-->\s*<hr[^>]*/?>\s*<!--\s*/wp:separator\s*-->',
-            r'<hr\s+class="wp-block-separator[^"]*"[^>]*/>',
-            r'<hr\s+class="wp-block-separator[^"]*"[^>]*>',
-        ]
+        content = self.replace_blocks(content, 'separator', r'\s*<hr[^<>]*>\s*', lambda attrs, match: '\n---\n')
         
-        for pattern in patterns:
-            content = re.sub(pattern, '\n---\n', content, flags=re.DOTALL)
+        # 或者 <hr class="wp-block-separator" />
+        content = self.rule_sub(r'<hr\s+class="wp-block-separator[^"<>]*"[^<>]*>', '\n---\n', content)
         
         return content
     
+    def load_content_index(self):
+        """加载图片内容索引（SHA-256 -> 已保存的文件）"""
+        index_file = os.path.join(self.typecho_root, CONVERT_CONFIG['image_index_file'])
+        if not os.path.exists(index_file):
+            return
+        
+        try:
+            with open(index_file, 'r', encoding='utf-8') as f:
+                index = json.load(f)
+        except Exception as e:
+            print(f"  警告: 图片索引读取失败 ({index_file}): {e}")
+            return
+        
+        # 只保留文件仍然存在的条目
+        for digest, image_info in index.items():
+            local_file = os.path.join(self.typecho_root, image_info['path'].lstrip('/'))
+            if os.path.exists(local_file):
+                self.content_index[digest] = image_info
+        
+        print(f"✓ 已加载图片索引: {len(self.content_index)} 个文件\n")
+    
+    def save_content_index(self):
+        """保存图片内容索引"""
+        if not self.content_index:
+            return
+        
+        index_file = os.path.join(self.typecho_root, CONVERT_CONFIG['image_index_file'])
+        try:
+            os.makedirs(os.path.dirname(index_file), exist_ok=True)
+            tmp_file = index_file + '.tmp'
+            with open(tmp_file, 'w', encoding='utf-8') as f:
+                json.dump(self.content_index, f, ensure_ascii=False)
+            os.replace(tmp_file, index_file)
+        except Exception as e:
+            print(f"  警告: 图片索引保存失败 ({index_file}): {e}")
+    
+    def sniff_image_mime(self, head):
+        """根据文件头识别图片MIME类型，无法识别时返回None"""
+        if head.startswith(b'\xff\xd8\xff'):
+            return 'image/jpeg'
+        if head.startswith(b'\x89PNG\r\n\x1a\n'):
+            return 'image/png'
+        if head.startswith((b'GIF87a', b'GIF89a')):
+            return 'image/gif'
+        if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+            return 'image/webp'
+        if head[4:12] in (b'ftypavif', b'ftypavis'):
+            return 'image/avif'
+        if head.startswith(b'BM'):
+            return 'image/bmp'
+        if b'<svg' in head[:1024]:
+            return 'image/svg+xml'
+        return None
+    
+    def fetch_to_temp_file(self, image_url, upload_dir):
+        """分块下载图片到临时文件，返回 (临时文件路径, SHA-256, 大小, 识别出的MIME)"""
+        max_size = CONVERT_CONFIG['max_image_size']
+        chunk_size = CONVERT_CONFIG['download_chunk_size']
+        
+        headers = {'User-Agent': 'Mozilla/5.0'}
+        req = urllib.request.Request(image_url, headers=headers)
+        
+        fd, tmp_path = tempfile.mkstemp(prefix='.download-', dir=upload_dir)
+        try:
+            # 先包装 fd，urlopen 失败（404、超时等）时 with 也会关闭它
+            with os.fdopen(fd, 'wb') as f, urllib.request.urlopen(req, timeout=30) as response:
+                content_length = response.headers.get('Content-Length')
+                expected_size = int(content_length) if content_length and content_length.isdigit() else None
+                if expected_size is not None and expected_size > max_size:
+                    raise ValueError(f"文件过大 ({expected_size} 字节，上限 {max_size} 字节)")
+                
+                sha256 = hashlib.sha256()
+                sniffed_mime = None
+                received = 0
+                while True:
+                    chunk = response.read(chunk_size)
+                    if not chunk:
+                        break
+                    if received == 0:
+                        sniffed_mime = self.sniff_image_mime(chunk)
+                    received += len(chunk)
+                    if received > max_size:
+                        raise ValueError(f"文件超过大小上限 ({max_size} 字节)")
+                    sha256.update(chunk)
+                    f.write(chunk)
+            
+            # 接收的字节数与 Content-Length 不一致说明传输被截断
+            if expected_size is not None and received != expected_size:
+                raise ValueError(f"下载不完整 ({received}/{expected_size} 字节)")
+            
+            # mkstemp 创建的文件默认仅属主可读
+            os.chmod(tmp_path, 0o644)
+            return tmp_path, sha256.hexdigest(), received, sniffed_mime
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def resolve_local_upload(self, url_path):
+        """将 wp-content/uploads/... 路径映射到本地 uploads 目录，文件不存在时返回None"""
+        uploads_dir = CONVERT_CONFIG['local_uploads_dir']
+        if not uploads_dir:
+            return None
+        
+        marker = '/wp-content/uploads/'
+        pos = url_path.find(marker)
+        if pos == -1:
+            return None
+        
+        # 防止 ../ 跳出 uploads 目录
+        uploads_dir = os.path.realpath(uploads_dir)
+        relative = urllib.parse.unquote(url_path[pos + len(marker):])
+        source_path = os.path.realpath(os.path.join(uploads_dir, relative))
+        if not source_path.startswith(uploads_dir + os.sep):
+            return None
+        
+        return source_path if os.path.isfile(source_path) else None
+    
+    def copy_local_to_temp_file(self, source_path, upload_dir):
+        """把本地图片放到目标目录的临时文件中，返回值与 fetch_to_temp_file 相同
+        
+        同一文件系统上优先创建硬链接，否则用 copy_file_range / sendfile 在内核中复制。
+        """
+        max_size = CONVERT_CONFIG['max_image_size']
+        chunk_size = CONVERT_CONFIG['download_chunk_size']
+        
+        # 计算SHA-256和MIME（只读取，不在用户态复制）
+        file_size = os.path.getsize(source_path)
+        if file_size > max_size:
+            raise ValueError(f"文件过大 ({file_size} 字节，上限 {max_size} 字节)")
+        
+        sha256 = hashlib.sha256()
+        sniffed_mime = None
+        with open(source_path, 'rb') as f:
+            chunk = f.read(chunk_size)
+            sniffed_mime = self.sniff_image_mime(chunk)
+            while chunk:
+                sha256.update(chunk)
+                chunk = f.read(chunk_size)
+        digest = sha256.hexdigest()
+        
+        fd, tmp_path = tempfile.mkstemp(prefix='.copy-', dir=upload_dir)
+        try:
+            if CONVERT_CONFIG['local_uploads_hardlink']:
+                try:
+                    os.close(fd)
+                    fd = None
+                    os.remove(tmp_path)
+                    os.link(source_path, tmp_path)
+                    return tmp_path, digest, file_size, sniffed_mime
+                except OSError:
+                    # 跨文件系统等情况无法硬链接，改为复制
+                    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            
+            with open(source_path, 'rb') as src:
+                self._copy_file_data(src.fileno(), fd, file_size)
+            os.close(fd)
+            fd = None
+            os.chmod(tmp_path, 0o644)
+            return tmp_path, digest, file_size, sniffed_mime
+        except BaseException:
+            if fd is not None:
+                os.close(fd)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+    
+    def _copy_file_data(self, src_fd, dst_fd, size):
+        """在内核中复制文件内容，不支持时退回普通读写"""
+        copied = 0
+        if hasattr(os, 'copy_file_range'):
+            try:
+                while copied < size:
+                    sent = os.copy_file_range(src_fd, dst_fd, size - copied)
+                    if sent == 0:
+                        break
+                    copied += sent
+                return
+            except OSError:
+                if copied:
+                    raise
+        
+        if hasattr(os, 'sendfile'):
+            try:
+                while copied < size:
+                    sent = os.sendfile(dst_fd, src_fd, copied, size - copied)
+                    if sent == 0:
+                        break
+                    copied += sent
+                return
+            except OSError:
+                if copied:
+                    raise
+        
+        chunk_size = CONVERT_CONFIG['download_chunk_size']
+        while True:
+            chunk = os.read(src_fd, chunk_size)
+            if not chunk:
+                break
+            os.write(dst_fd, chunk)
+    
+    def load_variant_map(self):
+        """从WordPress数据库的 _wp_attachment_metadata 读取尺寸版本与原图的对应关系"""
+        if not WORDPRESS_CONFIG:
+            return
+        
+        try:
+            wp_conn = pymysql.connect(**WORDPRESS_CONFIG)
+        except Exception as e:
+            print(f"  警告: 无法连接WordPress数据库，使用文件名规则识别尺寸版本: {e}")
+            return
+        
+        try:
+            cursor = wp_conn.cursor()
+            cursor.execute("SELECT meta_value FROM wp_postmeta WHERE meta_key = '_wp_attachment_metadata'")
+            for (meta_value,) in cursor.fetchall():
+                # PHP序列化数据，第一个 file 是原图相对路径，其余为 sizes 中各尺寸的文件名
+                files = re.findall(r's:4:"file";s:\d+:"([^"]*)"', meta_value or '')
+                if not files:
+                    continue
+                original = files[0]
+                directory = os.path.dirname(original)
+                for variant in files[1:]:
+                    self.variant_map[f"{directory}/{variant}" if directory else variant] = original
+        finally:
+            wp_conn.close()
+        
+        print(f"✓ 已加载图片尺寸映射: {len(self.variant_map)} 个尺寸版本\n")
+    
+    def resolve_original_url(self, image_url):
+        """将 image-300x200.jpg 这类尺寸版本URL还原为原图URL"""
+        parsed_url = urllib.parse.urlparse(image_url)
+        marker = '/wp-content/uploads/'
+        pos = parsed_url.path.find(marker)
+        if pos == -1:
+            return image_url
+        
+        prefix = parsed_url.path[:pos + len(marker)]
+        relative = urllib.parse.unquote(parsed_url.path[pos + len(marker):])
+        
+        if relative in self.variant_map:
+            original = self.variant_map[relative]
+        else:
+            original = re.sub(r'-\d+x\d+(\.\w+)$', r'\1', relative)
+        
+        if original == relative:
+            return image_url
+        
+        path = prefix + urllib.parse.quote(original)
+        return urllib.parse.urlunparse(parsed_url._replace(path=path, query='', fragment=''))
+    
     def download_image(self, image_url):
+        """下载图片并保存到本地（尺寸版本统一使用原图）"""
+        if image_url in self.downloaded_images:
+            return self.downloaded_images[image_url]
+        
+        original_url = self.resolve_original_url(image_url)
+        if (original_url != image_url and original_url not in self.missing_originals
+                and CONVERT_CONFIG['local_uploads_dir']
+                and not self.resolve_local_upload(urllib.parse.urlparse(original_url).path)
+                and self.resolve_local_upload(urllib.parse.urlparse(image_url).path)):
+            # 本地模式下原图不在本地而尺寸版本在，直接复制尺寸版本，不向线上站点请求原图
+            self.missing_originals.add(original_url)
+        
+        if original_url != image_url and original_url not in self.missing_originals:
+            image_info = self.fetch_image(original_url)
+            if image_info:
+                self.variant_count += 1
+                self.downloaded_images[image_url] = image_info
+                return image_info
+            # 原图不存在（例如文件名本身带有 -WxH），按原URL下载
+            self.missing_originals.add(original_url)
+        
+        return self.fetch_image(image_url)
+    
+    def fetch_image(self, image_url):
         """下载图片并保存到本地"""
         # 如果已经下载过，直接返回本地URL
         if image_url in self.downloaded_images:
@@ -262,6 +750,28 @@ class GutenbergToMarkdown:
             file_name = os.path.basename(url_path)
             name_without_ext, ext = os.path.splitext(file_name)
             
+            # 优先从本地 uploads 目录复制，找不到时再通过HTTP流式下载
+            fetched = None
+            source_path = self.resolve_local_upload(url_path)
+            if source_path:
+                try:
+                    fetched = self.copy_local_to_temp_file(source_path, upload_dir)
+                    action = '复制图片'
+                except OSError as e:
+                    print(f"    ! 本地复制失败，改用HTTP下载 ({source_path}): {e}")
+            if fetched is None:
+                fetched = self.fetch_to_temp_file(image_url, upload_dir)
+                action = '下载图片'
+            tmp_path, digest, file_size, sniffed_mime = fetched
+            
+            # 内容相同的图片只保存一份，复用已有文件和附件记录
+            if digest in self.content_index:
+                os.remove(tmp_path)
+                self.downloaded_images[image_url] = self.content_index[digest]
+                self.dedup_count += 1
+                print(f"    = 内容重复，复用: {self.content_index[digest]['path']}")
+                return self.downloaded_images[image_url]
+            
             # 检查文件是否已存在，如果存在则添加数字后缀
             local_path = os.path.join(upload_dir, file_name)
             counter = 1
@@ -271,20 +781,10 @@ class GutenbergToMarkdown:
                 file_name = new_name
                 counter += 1
             
-            # 下载图片
-            headers = {'User-Agent': 'Mozilla/5.0'}
-            req = urllib.request.Request(image_url, headers=headers)
-            with urllib.request.urlopen(req, timeout=30) as response:
-                image_data = response.read()
-            
-            # 保存图片
-            with open(local_path, 'wb') as f:
-                f.write(image_data)
-            
-            # 获取文件信息
-            file_size = len(image_data)
+            # 下载完成后再原子地移动到目标位置
+            os.replace(tmp_path, local_path)
             
-            # 确定MIME类型
+            # 确定MIME类型（优先使用文件头识别的结果）
             mime_types = {
                 '.jpg': 'image/jpeg',
                 '.jpeg': 'image/jpeg', 
@@ -293,7 +793,7 @@ class GutenbergToMarkdown:
                 '.webp': 'image/webp',
                 '.svg': 'image/svg+xml',
             }
-            mime_type = mime_types.get(ext.lower(), 'image/jpeg')
+            mime_type = sniffed_mime or mime_types.get(ext.lower(), 'image/jpeg')
             
             # 相对路径（用于数据库）
             relative_path = f"/usr/uploads/{year_month}/{file_name}"
@@ -308,75 +808,96 @@ class GutenbergToMarkdown:
                 'name': file_name,
                 'size': file_size,
                 'type': ext.lstrip('.'),
-                'mime': mime_type
+                'mime': mime_type,
+                'sha256': digest
             }
+            self.content_index[digest] = self.downloaded_images[image_url]
             
-            print(f"    ✓ 下载图片: {file_name} -> {year_month}/{file_name}")
+            print(f"    ✓ {action}: {file_name} -> {year_month}/{file_name}")
             return self.downloaded_images[image_url]
             
         except Exception as e:
             print(f"    ✗ 下载失败 ({image_url}): {e}")
             return None
     
+    def load_attachment_index(self):
+        """一次性加载已有附件的路径索引"""
+        cursor = self.conn.cursor()
+        cursor.execute("SELECT text FROM typecho_contents WHERE type = 'attachment'")
+        
+        for (text,) in cursor.fetchall():
+            try:
+                attachment_data = json.loads(text)
+            except (TypeError, ValueError):
+                continue
+            if isinstance(attachment_data, dict) and attachment_data.get('path'):
+                self.attachment_paths.add(attachment_data['path'])
+        
+        print(f"✓ 已加载附件索引: {len(self.attachment_paths)} 个附件\n")
+    
     def create_attachment_record(self, image_info, parent_cid):
-        """在数据库中创建附件记录"""
+        """创建附件记录（加入待写入队列，由 flush_attachments 批量插入）"""
+        # 检查附件是否已存在
+        if image_info['path'] in self.attachment_paths:
+            return  # 附件已存在
+        
+        # 准备附件元数据
+        attachment_data = {
+            "name": image_info['name'],
+            "path": image_info['path'],
+            "size": image_info['size'],
+            "type": image_info['type'],
+            "mime": image_info['mime']
+        }
+        
+        # 生成slug
+        slug = re.sub(r'[^\w\-]', '-', image_info['name'])
+        slug = re.sub(r'-+', '-', slug).strip('-').lower()
+        
+        now = int(time.time())
+        self.pending_attachments.append((
+            image_info['name'],
+            slug,
+            now,
+            now,
+            json.dumps(attachment_data, ensure_ascii=False),
+            0,
+            1,  # 默认管理员ID
+            None,
+            'attachment',
+            'publish',
+            None,
+            0,
+            '1',
+            '0',
+            '1',
+            parent_cid
+        ))
+        self.attachment_paths.add(image_info['path'])
+    
+    def flush_attachments(self):
+        """批量插入待写入的附件记录"""
+        if not self.pending_attachments:
+            return
+        
+        insert_sql = """
+            INSERT INTO typecho_contents 
+            (title, slug, created, modified, text, `order`, authorId, template,
+            type, status, password, commentsNum, allowComment, allowPing, allowFeed, parent)
+            VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
+        """
+        
         try:
             cursor = self.conn.cursor()
-            
-            # 检查附件是否已存在
-            cursor.execute(
-                "SELECT cid FROM typecho_contents WHERE type = 'attachment' AND text LIKE %s",
-                (f'%{image_info["name"]}%',)
-            )
-            
-            if cursor.fetchone():
-                return  # 附件已存在
-            
-            # 准备附件元数据
-            attachment_data = {
-                "name": image_info['name'],
-                "path": image_info['path'],
-                "size": image_info['size'],
-                "type": image_info['type'],
-                "mime": image_info['mime']
-            }
-            
-            # 生成slug
-            slug = re.sub(r'[^\w\-]', '-', image_info['name'])
-            slug = re.sub(r'-+', '-', slug).strip('-').lower()
-            
-            # 插入附件记录
-            now = int(time.time())
-            insert_sql = """
-                INSERT INTO typecho_contents 
-                (title, slug, created, modified, text, `order`, authorId, template,
-                type, status, password, commentsNum, allowComment, allowPing, allowFeed, parent)
-                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-            """
-            
-            cursor.execute(insert_sql, (
-                image_info['name'],
-                slug,
-                now,
-                now,
-                json.dumps(attachment_data, ensure_ascii=False),
-                0,
-                1,  # 默认管理员ID
-                None,
-                'attachment',
-                'publish',
-                None,
-                0,
-                '1',
-                '0',
-                '1',
-                parent_cid
-            ))
-            
-            print(f"    ✓ 创建附件记录: {image_info['name']}")
-            
+            cursor.executemany(insert_sql, self.pending_attachments)
+            print(f"    ✓ 创建附件记录: {len(self.pending_attachments)} 条")
         except Exception as e:
             print(f"    ✗ 创建附件记录失败: {e}")
+            # 插入失败的附件从索引中移除，下次运行时重新创建
+            for row in self.pending_attachments:
+                self.attachment_paths.discard(json.loads(row[4])['path'])
+        
+        self.pending_attachments = []
     
     def process_images_in_content(self, content, cid):
         """处理内容中的所有图片"""
@@ -432,24 +953,28 @@ class GutenbergToMarkdown:
     def clean_html_tags(self, content):
         """清理剩余的HTML标签"""
         # 保留一些基本的HTML标签转换
-        content = re.sub(r'<strong>(.*?)</strong>', r'**\1**', content)
-        content = re.sub(r'<b>(.*?)</b>', r'**\1**', content)
-        content = re.sub(r'<em>(.*?)</em>', r'*\1*', content)
-        content = re.sub(r'<i>(.*?)</i>', r'*\1*', content)
-        content = re.sub(r'<code>(.*?)</code>', r'`\1`', content)
+        content = self.rule_sub(self.inline_tag_pattern('strong'), r'**\1**', content)
+        content = self.rule_sub(self.inline_tag_pattern('b'), r'**\1**', content)
+        content = self.rule_sub(self.inline_tag_pattern('em'), r'*\1*', content)
+        content = self.rule_sub(self.inline_tag_pattern('i'), r'*\1*', content)
+        content = self.rule_sub(self.inline_tag_pattern('code'), r'`\1`', content)
         
         # 转换mark标签（高亮标记）- 转为粗体
-        content = re.sub(r'<mark[^>]*>(.*?)</mark>', r'**\1**', content, flags=re.DOTALL)
+        content = self.rule_sub(self.inline_tag_pattern('mark', with_attrs=True, multiline=True), r'**\1**', content)
         
         # 转换链接
-        content = re.sub(r'<a[^>]*href="([^"]+)"[^>]*>(.*?)</a>', r'[\2](\1)', content)
+        content = self.rule_sub(
+            r'<a\s[^<>]*?href="([^"<>]+)"[^<>]*>([^<\n]*(?:<(?!/?a\b)[^<\n]*)*)</a>',
+            r'[\2](\1)',
+            content
+        )
         
         # 移除段落标签但保留内容
-        content = re.sub(r'<p[^>]*>', '\n', content)
-        content = re.sub(r'</p>', '\n', content)
+        content = self.rule_sub(r'<p[^<>]*>', '\n', content)
+        content = self.rule_sub(r'</p>', '\n', content)
         
         # 移除其他古腾堡注释
-        content = re.sub(r'<!--\s*/?wp:[^>]*-->', '', content)
+        content = self.rule_sub(r'<!--\s*/?wp:[^<>]*-->', '', content)
         
         return content
     
@@ -473,14 +998,14 @@ class GutenbergToMarkdown:
         
         try:
             # 按顺序转换各种块
-            content = self.convert_code_block(content)
-            content = self.convert_heading(content)
-            content = self.convert_list(content)
-            content = self.convert_quote(content)
-            content = self.convert_image(content)
-            content = self.convert_separator(content)
-            content = self.convert_paragraph(content)
-            content = self.clean_html_tags(content)
+            content = self.run_rule('convert_code_block', self.convert_code_block, content)
+            content = self.run_rule('convert_heading', self.convert_heading, content)
+            content = self.run_rule('convert_list', self.convert_list, content)
+            content = self.run_rule('convert_quote', self.convert_quote, content)
+            content = self.run_rule('convert_image', self.convert_image, content)
+            content = self.run_rule('convert_separator', self.convert_separator, content)
+            content = self.run_rule('convert_paragraph', self.convert_paragraph, content)
+            content = self.run_rule('clean_html_tags', self.clean_html_tags, content)
             
             # 清理多余的空行
             content = re.sub(r'\n{3,}', '\n\n', content)
@@ -491,38 +1016,154 @@ class GutenbergToMarkdown:
                 content = '<!--markdown-->' + content
             
             return content
+        except ConversionTimeout:
+            raise
         except Exception as e:
             print(f"  转换出错: {e}")
             return original_content
     
+    def save_post(self, cid, text):
+        """保存转换后的文章内容（批量模式下先加入待更新队列）"""
+        if CONVERT_CONFIG['bulk_update']:
+            self.pending_updates.append((cid, text))
+            return
+        
+        cursor = self.conn.cursor()
+        cursor.execute(
+            "UPDATE typecho_contents SET text = %s WHERE cid = %s",
+            (text, cid)
+        )
+    
+    def flush_updates(self):
+        """通过临时表批量更新文章：多行INSERT写入临时表，再用一条 UPDATE ... JOIN 应用"""
+        if not self.pending_updates:
+            return
+        
+        cursor = self.conn.cursor()
+        cursor.execute("""
+            CREATE TEMPORARY TABLE IF NOT EXISTS typecho_convert_staging (
+                cid INT UNSIGNED NOT NULL PRIMARY KEY,
+                text LONGTEXT
+            ) DEFAULT CHARSET=utf8mb4
+        """)
+        # executemany 会合并为多行 INSERT，并按语句长度自动拆分
+        cursor.executemany(
+            "INSERT INTO typecho_convert_staging (cid, text) VALUES (%s, %s)",
+            self.pending_updates
+        )
+        cursor.execute("""
+            UPDATE typecho_contents c
+            INNER JOIN typecho_convert_staging s ON c.cid = s.cid
+            SET c.text = s.text
+        """)
+        cursor.execute("DELETE FROM typecho_convert_staging")
+        
+        self.pending_updates = []
+    
+    def ensure_state_table(self, create=True):
+        """确保转换状态表存在，create=False 时只检查（预览模式不修改数据库）"""
+        cursor = self.conn.cursor()
+        if not create:
+            cursor.execute("SHOW TABLES LIKE 'typecho_convert_state'")
+            return cursor.fetchone() is not None
+        
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS typecho_convert_state (
+                cid INT UNSIGNED NOT NULL PRIMARY KEY,
+                content_hash CHAR(64) NOT NULL,
+                converted_at INT UNSIGNED NOT NULL
+            ) DEFAULT CHARSET=utf8mb4
+        """)
+        return True
+    
+    def record_state(self, cid, text):
+        """记录文章当前内容的哈希，下次运行时内容未变化的文章不再处理"""
+        content_hash = hashlib.sha256((text or '').encode('utf-8')).hexdigest()
+        self.pending_states.append((cid, content_hash, int(time.time())))
+    
+    def flush_states(self):
+        """批量写入转换状态"""
+        if not self.pending_states:
+            return
+        
+        cursor = self.conn.cursor()
+        cursor.executemany("""
+            INSERT INTO typecho_convert_state (cid, content_hash, converted_at)
+            VALUES (%s, %s, %s)
+            ON DUPLICATE KEY UPDATE content_hash = VALUES(content_hash), converted_at = VALUES(converted_at)
+        """, self.pending_states)
+        
+        self.pending_states = []
+    
+    def commit_batch(self):
+        """写入待处理的文章和附件并提交"""
+        self.flush_updates()
+        self.flush_attachments()
+        self.flush_states()
+        self.conn.commit()
+        if self.cache_conn:
+            self.cache_conn.commit()
+    
     def process_all_posts(self, dry_run=False):
         """处理所有文章"""
         cursor = self.conn.cursor(pymysql.cursors.DictCursor)
         
-        # 获取所有包含古腾堡块的文章（注释或类名）
-        cursor.execute("""
-            SELECT cid, title, text 
-            FROM typecho_contents 
-            WHERE type = 'post' AND (text LIKE '%<!-- wp:%' OR text LIKE '%wp-block-%')
-            ORDER BY cid
-        """)
+        track_state = CONVERT_CONFIG['track_state'] and self.ensure_state_table(create=not dry_run)
+        if track_state:
+            # 只取新增文章和上次转换后在后台修改过的文章（按cid关联状态表）
+            cursor.execute("""
+                SELECT c.cid, c.title, c.text, s.content_hash
+                FROM typecho_contents c
+                LEFT JOIN typecho_convert_state s ON s.cid = c.cid
+                WHERE c.type = 'post' AND (s.cid IS NULL OR c.modified > s.converted_at)
+                ORDER BY c.cid
+            """)
+        else:
+            # 获取所有包含古腾堡块的文章（注释或类名）
+            cursor.execute("""
+                SELECT cid, title, text 
+                FROM typecho_contents 
+                WHERE type = 'post' AND (text LIKE '%<!-- wp:%' OR text LIKE '%wp-block-%')
+                ORDER BY cid
+            """)
         
         posts = cursor.fetchall()
         total = len(posts)
         
-        print(f"找到 {total} 篇包含古腾堡块的文章\n")
+        if track_state:
+            print(f"找到 {total} 篇新增或修改过的文章\n")
+        else:
+            print(f"找到 {total} 篇包含古腾堡块的文章\n")
         
         if total == 0:
             return
         
+        self.open_conversion_cache()
+        
         if dry_run:
             print("=== 预览模式（不会修改数据库）===\n")
+        else:
+            self.load_content_index()
+            self.load_attachment_index()
+            self.load_variant_map()
+        
+        batch_size = CONVERT_CONFIG['bulk_update_batch_size'] if CONVERT_CONFIG['bulk_update'] else 10
         
         for i, post in enumerate(posts, 1):
             print(f"[{i}/{total}] 处理: {post['title'][:50]}")
             
             original_content = post['text']
-            converted_content = self.convert_to_markdown(original_content)
+            
+            # 内容与上次记录的哈希相同（仅修改时间变化），无需处理
+            content_hash = hashlib.sha256((original_content or '').encode('utf-8')).hexdigest()
+            if track_state and post['content_hash'] == content_hash:
+                print(f"  - 内容未变化")
+                self.skipped_count += 1
+                if not dry_run:
+                    self.record_state(post['cid'], original_content)
+                continue
+            
+            converted_content = self.convert_with_cache(original_content, post['cid'])
             
             if original_content != converted_content:
                 if dry_run:
@@ -537,30 +1178,43 @@ class GutenbergToMarkdown:
                     )
                     
                     # 更新数据库
-                    update_cursor = self.conn.cursor()
-                    update_cursor.execute(
-                        "UPDATE typecho_contents SET text = %s WHERE cid = %s",
-                        (final_content, post['cid'])
-                    )
+                    self.save_post(post['cid'], final_content)
+                    if track_state:
+                        self.record_state(post['cid'], final_content)
                     print(f"  ✓ 已转换并保存")
                     self.converted_count += 1
                     
-                    # 每10篇提交一次
-                    if self.converted_count % 10 == 0:
-                        self.conn.commit()
+                    # 每10篇（批量模式下每 bulk_update_batch_size 篇）提交一次
+                    if self.converted_count % batch_size == 0:
+                        self.commit_batch()
                         print(f"  [已提交 {self.converted_count} 篇]")
             else:
                 print(f"  - 无需转换")
                 self.skipped_count += 1
+                if track_state and not dry_run and post['cid'] not in self.timeout_cids:
+                    self.record_state(post['cid'], original_content)
         
         if not dry_run:
-            self.conn.commit()
+            self.commit_batch()
+            self.save_content_index()
         
         print(f"\n{'=' * 60}")
         print(f"处理完成！")
         print(f"转换: {self.converted_count} 篇")
         print(f"跳过: {self.skipped_count} 篇")
+        if self.dedup_count:
+            print(f"重复图片: {self.dedup_count} 张（已复用）")
+        if self.variant_count:
+            print(f"尺寸版本: {self.variant_count} 张（已替换为原图）")
+        if self.cache_hits or self.cache_misses:
+            hit_rate = self.cache_hits / (self.cache_hits + self.cache_misses) * 100
+            print(f"转换缓存: 命中 {self.cache_hits} / 未命中 {self.cache_misses}（命中率 {hit_rate:.1f}%）")
+        if self.timeout_cids:
+            print(f"转换超时: {len(self.timeout_cids)} 篇，cid: {', '.join(str(cid) for cid in self.timeout_cids)}")
         print(f"{'=' * 60}\n")
+        
+        if CONVERT_CONFIG['profile']:
+            self.report_profile()
     
     def preview_single_post(self, cid):
         """预览单篇文章的转换结果"""
@@ -614,8 +1268,142 @@ class GutenbergToMarkdown:
         finally:
             self.close_db()
 
+# ---------------------------------------------------------------------------
+# 离线转换：不连接数据库，直接转换文件、标准输入或WXR导出文件中的内容
+# ---------------------------------------------------------------------------
+
+WXR_NAMESPACES = {
+    'content': 'http://purl.org/rss/1.0/modules/content/',
+    'wp': 'http://wordpress.org/export/1.2/',
+}
+
+_offline_converter = None
+
+
+def convert_text(content):
+    """离线转换单篇内容，供多进程调用"""
+    global _offline_converter
+    if _offline_converter is None:
+        _offline_converter = GutenbergToMarkdown()
+    return _offline_converter.convert_to_markdown(content)
+
+
+def convert_texts(contents, workers=1, batch_size=256):
+    """按输入顺序逐篇转换，workers > 1 时使用多进程
+    
+    多进程模式下按 batch_size 分批读取输入，避免一次性把全部内容读入内存。
+    """
+    if workers <= 1:
+        for content in contents:
+            yield convert_text(content)
+        return
+    
+    chunksize = max(1, batch_size // (workers * 4))
+    with multiprocessing.Pool(workers) as pool:
+        batch = []
+        for content in contents:
+            batch.append(content)
+            if len(batch) >= batch_size:
+                yield from pool.map(convert_text, batch, chunksize)
+                batch = []
+        if batch:
+            yield from pool.map(convert_text, batch, chunksize)
+
+
+def iter_wxr_contents(wxr_file):
+    """流式读取WXR中每个 <item> 的 post_id、slug、类型和 content:encoded"""
+    channel = None
+    for event, element in ET.iterparse(wxr_file, events=('start', 'end')):
+        if event == 'start':
+            if element.tag == 'channel':
+                channel = element
+            continue
+        if element.tag != 'item':
+            continue
+        content = element.find('content:encoded', WXR_NAMESPACES)
+        yield {
+            'post_id': element.findtext('wp:post_id', '', WXR_NAMESPACES),
+            'slug': element.findtext('wp:post_name', '', WXR_NAMESPACES),
+            'type': element.findtext('wp:post_type', '', WXR_NAMESPACES),
+            'content': content.text if content is not None and content.text else '',
+        }
+        # 清空 channel，丢弃已处理的 item（只清空 item 本身仍会留在 channel 中），内存不随文章数增长
+        if channel is not None:
+            channel.clear()
+
+
+def convert_files(paths, output_dir=None, workers=1):
+    """转换文件或标准输入（'-'），未指定输出目录时写到标准输出"""
+    def read_inputs():
+        for path in paths:
+            if path == '-':
+                yield sys.stdin.read()
+            else:
+                with open(path, 'r', encoding='utf-8') as f:
+                    yield f.read()
+    
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)
+    
+    for path, markdown in zip(paths, convert_texts(read_inputs(), workers)):
+        if not output_dir:
+            sys.stdout.write(markdown + '\n')
+            continue
+        name = 'stdin' if path == '-' else os.path.splitext(os.path.basename(path))[0]
+        with open(os.path.join(output_dir, name + '.md'), 'w', encoding='utf-8') as f:
+            f.write(markdown)
+
+
+def convert_wxr(wxr_file, output_dir, workers=1, post_types=('post', 'page')):
+    """转换WXR导出文件中的文章，每篇写成 <post_id>-<slug>.md"""
+    os.makedirs(output_dir, exist_ok=True)
+    
+    pending_items = collections.deque()
+    
+    def read_contents():
+        for item in iter_wxr_contents(wxr_file):
+            if item['type'] in post_types:
+                pending_items.append(item)
+                yield item['content']
+    
+    count = 0
+    for markdown in convert_texts(read_contents(), workers):
+        item = pending_items.popleft()
+        name = f"{item['post_id']}-{item['slug'] or 'untitled'}.md"
+        with open(os.path.join(output_dir, name), 'w', encoding='utf-8') as f:
+            f.write(markdown)
+        count += 1
+    
+    print(f"✓ 已转换 {count} 篇文章 -> {output_dir}")
+
+
+def run_offline(argv):
+    """offline 模式命令行入口"""
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        prog='convert_gutenberg_to_markdown.py offline',
+        description='不连接数据库，将文件、标准输入或WXR导出文件中的古腾堡内容转换为Markdown'
+    )
+    parser.add_argument('inputs', nargs='+', help="输入文件，'-' 表示标准输入；使用 --wxr 时为WXR导出文件")
+    parser.add_argument('--wxr', action='store_true', help='输入为WordPress WXR导出文件')
+    parser.add_argument('-o', '--output-dir', help='输出目录（默认写到标准输出，--wxr 时默认 markdown_output）')
+    parser.add_argument('-j', '--workers', type=int, default=1, help='并行进程数 (默认: 1)')
+    args = parser.parse_args(argv)
+    
+    if args.wxr:
+        for wxr_file in args.inputs:
+            convert_wxr(wxr_file, args.output_dir or 'markdown_output', args.workers)
+    else:
+        convert_files(args.inputs, args.output_dir, args.workers)
+
+
 if __name__ == "__main__":
-    import sys
+    if len(sys.argv) > 1 and sys.argv[1] == 'offline':
+        # python3 convert_gutenberg_to_markdown.py offline post.html -o out/
+        # python3 convert_gutenberg_to_markdown.py offline --wxr export.xml -o out/ -j 4
+        run_offline(sys.argv[2:])
+        sys.exit(0)
     
     converter = GutenbergToMarkdown()
     
@@ -631,6 +1419,7 @@ if __name__ == "__main__":
             print("  python3 convert_gutenberg_to_markdown.py              # 执行转换")
             print("  python3 convert_gutenberg_to_markdown.py dry-run      # 预览所有文章")
             print("  python3 convert_gutenberg_to_markdown.py preview 123  # 预览单篇文章")
+            print("  python3 convert_gutenberg_to_markdown.py offline ...  # 离线转换文件/WXR（不连接数据库）")
     else:
         # 直接执行转换
         converter.run(mode='convert')
@@ -10,6 +10,9 @@ import time
 import hashlib
 from datetime import datetime
 import re
+import collections
+import multiprocessing
+import urllib.parse
 
 # 数据库配置
 WORDPRESS_CONFIG = {
@@ -39,8 +42,161 @@ MIGRATION_CONFIG = {
     'migrate_comments': False,     # 是否迁移评论
     'only_published': True,       # 只迁移已发布的内容
     'default_password': 'typecho123',  # 默认用户密码
+    'rewrite_links': True,        # 是否把文章中的旧WordPress链接改写为Typecho链接
+    'typecho_site_url': None,     # Typecho站点地址，None 表示与WordPress的home相同
+    'typecho_post_url': '/archives/{cid}/',  # Typecho文章链接格式，可用 {cid} {slug} {year} {month} {day}
+    'typecho_page_url': '/{slug}.html',      # Typecho页面链接格式
+    'typecho_uploads_path': None,  # wp-content/uploads/ 改写后的路径，None 表示不改写（附件由古腾堡转换器下载并改写）
+    'link_rewrite_workers': 4,    # 改写链接的并行进程数
+    'link_rewrite_batch_size': 500,  # 每批读取和更新的文章数
+    'unresolved_links_file': 'unresolved_links.txt',  # 无法解析的旧链接报告
 }
 
+# 旧链接的结束位置：遇到空白、引号或括号
+LINK_TAIL_PATTERN = re.compile(r'[^\s"\'<>()\[\]]*')
+
+
+class LinkMatcher:
+    """
+    Aho-Corasick 多模式匹配
+    patterns: {旧链接: (新链接, 是否为前缀)}，新链接为 None 表示只记录为无法解析，为 False 表示保持不变
+    非前缀的旧链接必须在链接边界结束（后面不是字母数字、_、-、%，带查询参数的旧链接后面也不能是 & 或 =），
+    其后紧跟的 / 一并替换
+    """
+    
+    def __init__(self, patterns):
+        self.patterns = patterns
+        self.goto = [{}]
+        self.fail = [0]
+        self.terminal = [None]  # 在该状态结束的旧链接
+        self.output = [0]  # 沿失败链最近的终止状态
+        
+        for key in patterns:
+            state = 0
+            for char in key:
+                next_state = self.goto[state].get(char)
+                if next_state is None:
+                    next_state = len(self.goto)
+                    self.goto[state][char] = next_state
+                    self.goto.append({})
+                    self.fail.append(0)
+                    self.terminal.append(None)
+                    self.output.append(0)
+                state = next_state
+            self.terminal[state] = key
+        
+        # 广度优先计算失败链
+        queue = collections.deque(self.goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self.goto[state].items():
+                queue.append(next_state)
+                fail = self.fail[state]
+                while fail and char not in self.goto[fail]:
+                    fail = self.fail[fail]
+                fail = self.goto[fail].get(char, 0)
+                self.fail[next_state] = fail
+                self.output[next_state] = fail if self.terminal[fail] else self.output[fail]
+        
+        # 处于初始状态时直接跳到下一个可能开始匹配的字符
+        self.start_chars = re.compile('[' + ''.join(re.escape(char) for char in self.goto[0]) + ']')
+    
+    def match_end(self, text, end, key):
+        """检查匹配的边界，返回替换范围的结束位置，不是完整链接时返回 None"""
+        if self.patterns[key][1] or end >= len(text):
+            return end
+        char = text[end]
+        if char == '/':
+            return end + 1
+        if char.isalnum() or char in '_-%':
+            return None
+        # ?p=1&x=1 不是 ?p=1 的完整链接，不改写
+        if char in '&=' and '?' in key:
+            return None
+        return end
+    
+    def find(self, text):
+        """一次扫描返回最左最长且互不重叠的匹配 [(开始, 结束, 旧链接)]"""
+        goto, fail, terminal, output = self.goto, self.fail, self.terminal, self.output
+        longest = {}
+        state = 0
+        pos = 0
+        length = len(text)
+        
+        while pos < length:
+            if state == 0:
+                match = self.start_chars.search(text, pos)
+                if not match:
+                    break
+                pos = match.start()
+            char = text[pos]
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            pos += 1
+            
+            node = state if terminal[state] else output[state]
+            while node:
+                key = terminal[node]
+                end = self.match_end(text, pos, key)
+                if end is not None:
+                    start = pos - len(key)
+                    if start not in longest or end > longest[start][0]:
+                        longest[start] = (end, key)
+                node = output[node]
+        
+        matches = []
+        last_end = 0
+        for start in sorted(longest):
+            if start >= last_end:
+                end, key = longest[start]
+                matches.append((start, end, key))
+                last_end = end
+        return matches
+    
+    def rewrite(self, text):
+        """替换文本中的所有旧链接，返回 (新文本, 替换数, 无法解析的链接列表)"""
+        parts = []
+        pos = 0
+        rewritten = 0
+        unresolved = []
+        
+        for start, end, key in self.find(text):
+            replacement = self.patterns[key][0]
+            if replacement is False:
+                continue
+            if replacement is None:
+                tail = LINK_TAIL_PATTERN.match(text, end).end()
+                if tail > end:
+                    unresolved.append(text[start:tail])
+                continue
+            parts.append(text[pos:start])
+            parts.append(replacement)
+            pos = end
+            rewritten += 1
+        
+        if not rewritten:
+            return text, 0, unresolved
+        parts.append(text[pos:])
+        return ''.join(parts), rewritten, unresolved
+
+
+# 改写链接的工作进程各自构建一份自动机
+_link_matcher = None
+
+
+def _init_link_matcher(patterns):
+    global _link_matcher
+    _link_matcher = LinkMatcher(patterns)
+
+
+def _rewrite_post_links(row):
+    """工作进程：改写一篇文章，未修改时不回传正文"""
+    cid, text = row
+    new_text, rewritten, unresolved = _link_matcher.rewrite(text or '')
+    return cid, new_text if rewritten else None, rewritten, unresolved
+
+
 class WordPressToTypechoMigrator:
     def __init__(self):
         self.wp_conn = None
@@ -48,6 +204,7 @@ class WordPressToTypechoMigrator:
         self.user_map = {}      # WordPress用户ID -> Typecho用户ID
         self.post_map = {}      # WordPress文章ID -> Typecho文章ID
         self.term_map = {}      # WordPress分类/标签ID -> Typecho分类/标签ID
+        self.slug_map = {}      # WordPress文章ID -> Typecho slug
         self.stats = {
             'users': 0,
             'categories': 0,
@@ -55,7 +212,9 @@ class WordPressToTypechoMigrator:
             'posts': 0,
             'pages': 0,
             'comments': 0,
+            'links': 0,
         }
+        self.unresolved_links = {}  # 无法解析的旧链接 -> 出现的 Typecho cid 列表
     
     def connect_databases(self):
         """连接数据库"""
@@ -326,6 +485,7 @@ class WordPressToTypechoMigrator:
             
             if existing:
                 self.post_map[wp_post['ID']] = existing['cid']
+                self.slug_map[wp_post['ID']] = wp_post['post_name']
                 print(f"文章已存在: {wp_post['post_title'][:30]} (跳过)")
                 continue
             
@@ -358,9 +518,10 @@ class WordPressToTypechoMigrator:
             if wp_post['post_excerpt']:
                 text = f"<!--markdown-->\n{wp_post['post_excerpt']}\n\n<!--more-->\n\n{text}"
             
+            slug = self.clean_slug(wp_post['post_name']) or f"post-{wp_post['ID']}"
             typecho_cursor.execute(insert_sql, (
                 wp_post['post_title'],
-                self.clean_slug(wp_post['post_name']) or f"post-{wp_post['ID']}",
+                slug,
                 created,
                 modified,
                 text,
@@ -379,6 +540,7 @@ class WordPressToTypechoMigrator:
             
             new_cid = typecho_cursor.lastrowid
             self.post_map[wp_post['ID']] = new_cid
+            self.slug_map[wp_post['ID']] = slug
             self.stats['posts'] += 1
             
             # 迁移分类和标签关联
@@ -428,6 +590,7 @@ class WordPressToTypechoMigrator:
             
             if existing:
                 self.post_map[wp_page['ID']] = existing['cid']
+                self.slug_map[wp_page['ID']] = wp_page['post_name']
                 print(f"页面已存在: {wp_page['post_title'][:30]} (跳过)")
                 continue
             
@@ -455,9 +618,10 @@ class WordPressToTypechoMigrator:
                 VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
             """
             
+            slug = self.clean_slug(wp_page['post_name']) or f"page-{wp_page['ID']}"
             typecho_cursor.execute(insert_sql, (
                 wp_page['post_title'],
-                self.clean_slug(wp_page['post_name']) or f"page-{wp_page['ID']}",
+                slug,
                 created,
                 modified,
                 wp_page['post_content'],
@@ -476,6 +640,7 @@ class WordPressToTypechoMigrator:
             
             new_cid = typecho_cursor.lastrowid
             self.post_map[wp_page['ID']] = new_cid
+            self.slug_map[wp_page['ID']] = slug
             self.stats['pages'] += 1
             
             print(f"✓ 迁移页面: {wp_page['post_title'][:40]} (ID: {wp_page['ID']} -> {new_cid})")
@@ -614,6 +779,186 @@ class WordPressToTypechoMigrator:
         self.typecho_conn.commit()
         print(f"\n评论迁移完成: {self.stats['comments']} 条评论\n")
     
+    def get_wp_option(self, name):
+        """读取WordPress的 wp_options 配置"""
+        wp_cursor = self.wp_conn.cursor(pymysql.cursors.DictCursor)
+        wp_cursor.execute("SELECT option_value FROM wp_options WHERE option_name = %s", (name,))
+        row = wp_cursor.fetchone()
+        return row['option_value'] if row else ''
+    
+    def slug_variants(self, post_name):
+        """WordPress 的 post_name 以小写百分号编码保存，正文中的链接可能是原文或大写编码"""
+        decoded = urllib.parse.unquote(post_name)
+        return {post_name, decoded, urllib.parse.quote(decoded)}
+    
+    def expand_wp_permalink(self, structure, wp_post, post_name):
+        """按WordPress固定链接格式生成文章的旧路径，包含无法确定的标签时返回 None"""
+        if '%category%' in structure or '%author%' in structure:
+            return None
+        
+        post_date = wp_post['post_date']
+        if isinstance(post_date, str):
+            try:
+                post_date = datetime.strptime(post_date, '%Y-%m-%d %H:%M:%S')
+            except ValueError:
+                return None
+        
+        replacements = {
+            '%year%': f"{post_date.year:04d}",
+            '%monthnum%': f"{post_date.month:02d}",
+            '%day%': f"{post_date.day:02d}",
+            '%hour%': f"{post_date.hour:02d}",
+            '%minute%': f"{post_date.minute:02d}",
+            '%second%': f"{post_date.second:02d}",
+            '%post_id%': str(wp_post['ID']),
+            '%postname%': post_name,
+        }
+        return re.sub(r'%\w+%', lambda m: replacements.get(m.group(0), m.group(0)), structure)
+    
+    def build_link_patterns(self):
+        """为所有已迁移的文章和页面生成 {旧链接: (新链接, 是否为前缀)}"""
+        home = self.get_wp_option('home') or self.get_wp_option('siteurl')
+        if not home:
+            return {}
+        
+        # 不带协议匹配，改写后保留正文原来的 http/https
+        old_url = urllib.parse.urlsplit(home)
+        old_base = old_url.netloc + old_url.path.rstrip('/')
+        new_url = urllib.parse.urlsplit(MIGRATION_CONFIG['typecho_site_url'] or home)
+        new_base = '//' + new_url.netloc + new_url.path.rstrip('/')
+        
+        # 同时匹配带和不带 www. 的域名
+        if old_base.startswith('www.'):
+            old_bases = {old_base, old_base[4:]}
+        else:
+            old_bases = {old_base, 'www.' + old_base}
+        
+        structure = self.get_wp_option('permalink_structure')
+        
+        wp_cursor = self.wp_conn.cursor(pymysql.cursors.DictCursor)
+        wp_cursor.execute("""
+            SELECT ID, post_name, post_type, post_date, post_parent
+            FROM wp_posts
+            WHERE post_type IN ('post', 'page')
+        """)
+        wp_posts = {row['ID']: row for row in wp_cursor.fetchall()}
+        
+        paths = {}  # 旧路径 -> 新路径
+        for wp_id, cid in self.post_map.items():
+            wp_post = wp_posts.get(wp_id)
+            if not wp_post:
+                continue
+            
+            post_date = wp_post['post_date']
+            if isinstance(post_date, str):
+                post_date = datetime.strptime(post_date, '%Y-%m-%d %H:%M:%S')
+            template = MIGRATION_CONFIG['typecho_page_url' if wp_post['post_type'] == 'page' else 'typecho_post_url']
+            new_path = template.format(
+                cid=cid,
+                slug=self.slug_map.get(wp_id, wp_post['post_name']),
+                year=f"{post_date.year:04d}",
+                month=f"{post_date.month:02d}",
+                day=f"{post_date.day:02d}",
+            )
+            
+            paths[f"/?p={wp_id}"] = new_path
+            if wp_post['post_type'] == 'page':
+                paths[f"/?page_id={wp_id}"] = new_path
+            if not structure or not wp_post['post_name']:
+                continue
+            
+            if wp_post['post_type'] == 'page':
+                # 页面链接是按父页面拼接的路径
+                names = [wp_post['post_name']]
+                parent = wp_posts.get(wp_post['post_parent'])
+                while parent and len(names) < 10:
+                    names.insert(0, parent['post_name'])
+                    parent = wp_posts.get(parent['post_parent'])
+                prefix = '/index.php' if structure.startswith('/index.php') else ''
+                for name in self.slug_variants('/'.join(names)):
+                    paths[f"{prefix}/{name}/"] = new_path
+            else:
+                for name in self.slug_variants(wp_post['post_name']):
+                    old_path = self.expand_wp_permalink(structure, wp_post, name)
+                    if old_path:
+                        paths[old_path] = new_path
+        
+        patterns = {}
+        for base in old_bases:
+            for old_path, new_path in paths.items():
+                patterns['//' + base + old_path.rstrip('/')] = (new_base + new_path, False)
+            if MIGRATION_CONFIG['typecho_uploads_path']:
+                patterns['//' + base + '/wp-content/uploads/'] = (new_base + MIGRATION_CONFIG['typecho_uploads_path'], True)
+            else:
+                # 附件链接留给古腾堡转换器（它只处理含 wp-content/uploads 的链接），也不记为无法解析
+                patterns['//' + base + '/wp-content/uploads/'] = (False, True)
+            # 其余指向旧站的链接记录为无法解析
+            patterns['//' + base + '/'] = (None, True)
+        return patterns
+    
+    def rewrite_links(self):
+        """用多模式自动机一次扫描改写每篇文章中的旧链接，多进程并行，分批更新"""
+        if not MIGRATION_CONFIG['rewrite_links']:
+            print("跳过链接改写")
+            return
+        
+        print("=" * 60)
+        print("开始改写文章中的旧链接...")
+        print("=" * 60)
+        
+        patterns = self.build_link_patterns()
+        if not patterns or not self.post_map:
+            print("没有可改写的链接\n")
+            return
+        print(f"旧链接模式: {len(patterns)} 个")
+        
+        typecho_cursor = self.typecho_conn.cursor()
+        cids = sorted(set(self.post_map.values()))
+        batch_size = MIGRATION_CONFIG['link_rewrite_batch_size']
+        workers = MIGRATION_CONFIG['link_rewrite_workers']
+        
+        pool = None
+        if workers > 1:
+            pool = multiprocessing.Pool(workers, initializer=_init_link_matcher, initargs=(patterns,))
+            rewrite = lambda rows: pool.imap(_rewrite_post_links, rows, chunksize=16)
+        else:
+            _init_link_matcher(patterns)
+            rewrite = lambda rows: map(_rewrite_post_links, rows)
+        
+        try:
+            for i in range(0, len(cids), batch_size):
+                batch = cids[i:i + batch_size]
+                placeholders = ', '.join(['%s'] * len(batch))
+                typecho_cursor.execute(
+                    f"SELECT cid, text FROM typecho_contents WHERE cid IN ({placeholders})", batch
+                )
+                
+                updates = []
+                for cid, new_text, rewritten, unresolved in rewrite(typecho_cursor.fetchall()):
+                    if new_text is not None:
+                        updates.append((new_text, cid))
+                        self.stats['links'] += rewritten
+                    for link in unresolved:
+                        self.unresolved_links.setdefault(link, []).append(cid)
+                
+                if updates:
+                    typecho_cursor.executemany("UPDATE typecho_contents SET text = %s WHERE cid = %s", updates)
+                self.typecho_conn.commit()
+                print(f"  [已处理 {min(i + batch_size, len(cids))}/{len(cids)} 篇，更新 {len(updates)} 篇]")
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
+        
+        print(f"\n链接改写完成: {self.stats['links']} 个链接")
+        if self.unresolved_links:
+            report_file = MIGRATION_CONFIG['unresolved_links_file']
+            with open(report_file, 'w', encoding='utf-8') as f:
+                for link, link_cids in sorted(self.unresolved_links.items()):
+                    f.write(f"{link}\t{','.join(str(cid) for cid in sorted(set(link_cids)))}\n")
+            print(f"无法解析的旧链接: {len(self.unresolved_links)} 个，已写入 {report_file}")
+        print()
+    
     def print_summary(self):
         """打印迁移摘要"""
         print("\n" + "=" * 60)
@@ -625,6 +970,7 @@ class WordPressToTypechoMigrator:
         print(f"文章:   {self.stats['posts']} 篇")
         print(f"页面:   {self.stats['pages']} 个")
         print(f"评论:   {self.stats['comments']} 条")
+        print(f"链接:   {self.stats['links']} 个")
         print("=" * 60)
         print(f"\n提示: 默认用户密码为: {MIGRATION_CONFIG['default_password']}")
         print("请登录后台修改密码！\n")
@@ -647,6 +993,7 @@ class WordPressToTypechoMigrator:
             self.migrate_posts()
             self.migrate_pages()
             self.migrate_comments()
+            self.rewrite_links()
             
             # 打印摘要
             elapsed_time = time.time() - start_time
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+验证古腾堡转换规则的耗时与文章长度成线性关系
+使用一组畸形/超大文章（未闭合的块、标签、长空白等）作为压力语料
+"""
+
+import sys
+import time
+
+from convert_gutenberg_to_markdown import GutenbergToMarkdown
+
+# 压力语料：每个函数接收重复次数 n，返回一篇长度与 n 成正比的文章
+STRESS_CORPUS = {
+    '未闭合的代码块': lambda n: '<!-- wp:code --><pre><code>x = 1\n' * n,
+    '大量开始注释共用一个结束注释': lambda n: '<!-- wp:code -->print(1)\n' * n + '<!-- /wp:code -->',
+    '未闭合的图片块': lambda n: '<!-- wp:image --><figure><img src="a.jpg" alt="">' * n,
+    '图片块中没有img': lambda n: '<!-- wp:image --><figure>' + '<span>caption</span>' * n + '</figure><!-- /wp:image -->',
+    '未闭合的li': lambda n: '<!-- wp:list --><ul>' + '<li>item ' * n + '</ul><!-- /wp:list -->',
+    '未闭合的标题': lambda n: '<h2 class="wp-block-heading">title ' * n,
+    '未闭合的strong': lambda n: '<!-- wp:paragraph --><p>' + 'text <strong>bold ' * n,
+    '未闭合的链接': lambda n: '<!-- wp:paragraph --><p>' + '<a href="https://example.com/">link ' * n,
+    '未闭合的mark': lambda n: '<!-- wp:paragraph --><p>' + '<mark class="x">hi\n' * n,
+    '未闭合的古腾堡注释': lambda n: 'wp-block-x <!-- wp:foo {"a":1} ' * n,
+    '属性中缺少>': lambda n: 'wp-block-x ' + '<a href="x <p class="y' * n,
+    '长空白': lambda n: '<!-- wp:paragraph --><p>x</p>' + ' ' * (n * 20) + 'y',
+    '正常文章': lambda n: (
+        '<!-- wp:heading {"level":2} --><h2>标题</h2><!-- /wp:heading -->\n'
+        '<!-- wp:paragraph --><p>正文 <strong>粗体</strong> <a href="https://a.com">链接</a></p><!-- /wp:paragraph -->\n'
+        '<!-- wp:code {"language":"python"} --><pre class="wp-block-code"><code>print(1)</code></pre><!-- /wp:code -->\n'
+    ) * max(1, n // 8),
+}
+
+# 长度增加到 2^k 倍时，耗时最多允许增长 2^k * MAX_LINEAR_FACTOR 倍（二次方复杂度会增长 4^k 倍）
+MAX_LINEAR_FACTOR = 2.0
+
+
+def measure(converter, content, repeat=3):
+    """返回多次转换中最短的耗时（秒）"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        converter.convert_to_markdown(content)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def verify_linear_time(base_n=2000, doublings=3):
+    """对每类压力语料逐级加倍长度，检查耗时增长是否为线性"""
+    converter = GutenbergToMarkdown()
+    failures = []
+
+    print("=" * 80)
+    print("古腾堡转换规则线性时间验证")
+    print("=" * 80)
+    print(f"{'语料':<28}{'长度':>12}{'耗时(ms)':>12}{'相对增长':>12}")
+    print("-" * 80)
+
+    for name, build in STRESS_CORPUS.items():
+        first = None
+        for step in range(doublings + 1):
+            content = build(base_n * 2 ** step)
+            elapsed = measure(converter, content)
+            growth = elapsed / first if first else None
+            growth_text = f"{growth:.2f}" if growth is not None else '-'
+            print(f"{name if step == 0 else '':<28}{len(content):>12}{elapsed * 1000:>12.2f}{growth_text:>12}")
+            first = first or elapsed
+
+        # 以最小规模为基准比较总增长，减少单次计时抖动的影响
+        allowed = 2 ** doublings * MAX_LINEAR_FACTOR
+        if growth > allowed:
+            failures.append((name, growth, allowed))
+
+    print("-" * 80)
+    if failures:
+        for name, growth, allowed in failures:
+            print(f"✗ {name}: 耗时增长 {growth:.2f} 倍，超过线性上限 {allowed:.0f} 倍")
+        return False
+
+    print("✓ 所有语料的转换耗时均随长度线性增长")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if verify_linear_time() else 1)
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+验证图片下载的资源清理和本地模式
+对返回404的本地HTTP服务和无法连接的端口反复下载，检查没有泄漏文件描述符，
+也没有遗留 .download-* 临时文件；设置 local_uploads_dir 时，本地有原图或
+尺寸版本的图片不应向站点发起HTTP请求
+"""
+
+import http.server
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+from convert_gutenberg_to_markdown import CONVERT_CONFIG, GutenbergToMarkdown
+
+FAILED_FETCHES = 50
+
+
+class CountingHandler(http.server.BaseHTTPRequestHandler):
+    """所有请求都返回404，并记录请求的路径"""
+
+    requests = []
+
+    def do_GET(self):
+        CountingHandler.requests.append(self.path)
+        self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server():
+    server = http.server.HTTPServer(('127.0.0.1', 0), CountingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def closed_port():
+    """返回一个当前没有监听的端口"""
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def open_fds():
+    return len(os.listdir('/proc/self/fd'))
+
+
+def verify_failed_fetch_cleanup(server):
+    """下载失败后不应留下打开的文件描述符和临时文件"""
+    converter = GutenbergToMarkdown()
+    port = closed_port()
+    urls = [
+        f"http://127.0.0.1:{server.server_port}/wp-content/uploads/2020/05/missing.jpg",
+        f"http://127.0.0.1:{port}/wp-content/uploads/2020/05/refused.jpg",
+    ]
+
+    with tempfile.TemporaryDirectory() as upload_dir:
+        before = open_fds()
+        failures = 0
+        for i in range(FAILED_FETCHES):
+            try:
+                converter.fetch_to_temp_file(urls[i % len(urls)], upload_dir)
+            except Exception:
+                failures += 1
+        # 服务线程关闭连接可能稍有延迟，等待片刻再统计
+        deadline = time.monotonic() + 1
+        while open_fds() > before and time.monotonic() < deadline:
+            time.sleep(0.05)
+        leaked = open_fds() - before
+        leftovers = [name for name in os.listdir(upload_dir) if name.startswith('.download-')]
+
+    print(f"失败的下载: {failures}/{FAILED_FETCHES}")
+    print(f"泄漏的文件描述符: {leaked}")
+    print(f"遗留的临时文件: {len(leftovers)}")
+
+    ok = failures == FAILED_FETCHES and leaked <= 0 and not leftovers
+    print("✓ 下载失败后资源已全部释放" if ok else "✗ 下载失败后有资源未释放")
+    return ok
+
+
+def verify_local_variants(server):
+    """本地模式：原图或尺寸版本在本地时不请求站点，两者都不在本地时才走HTTP"""
+    base = f"http://127.0.0.1:{server.server_port}/wp-content/uploads/2020/05"
+    # (本地存在的文件, 文章中的图片, 期望的HTTP请求数)
+    cases = [
+        (['photo-300x200.jpg'], 'photo-300x200.jpg', 0),
+        (['photo.jpg', 'photo-300x200.jpg'], 'photo-300x200.jpg', 0),
+        ([], 'photo-300x200.jpg', 2),
+    ]
+    saved = CONVERT_CONFIG['local_uploads_dir']
+    ok = True
+    try:
+        for local_files, image, expected in cases:
+            with tempfile.TemporaryDirectory() as uploads, tempfile.TemporaryDirectory() as typecho_root:
+                os.makedirs(os.path.join(uploads, '2020/05'))
+                for name in local_files:
+                    with open(os.path.join(uploads, '2020/05', name), 'wb') as f:
+                        f.write(b'\xff\xd8\xff\xe0' + name.encode('utf-8'))
+                CONVERT_CONFIG['local_uploads_dir'] = uploads
+                converter = GutenbergToMarkdown()
+                converter.typecho_root = typecho_root
+
+                CountingHandler.requests.clear()
+                converter.download_image(f"{base}/{image}")
+                requests = len(CountingHandler.requests)
+            passed = requests == expected
+            ok = ok and passed
+            print(f"{'✓' if passed else '✗'} 本地文件 {local_files or '无'}: HTTP请求 {requests} 次（期望 {expected}）")
+    finally:
+        CONVERT_CONFIG['local_uploads_dir'] = saved
+    return ok
+
+
+def verify_image_fetch():
+    if not os.path.isdir('/proc/self/fd'):
+        print("需要 /proc/self/fd 统计文件描述符（Linux）")
+        return False
+
+    server = start_server()
+    try:
+        print("=" * 60)
+        print("图片下载资源清理验证")
+        print("=" * 60)
+        cleanup_ok = verify_failed_fetch_cleanup(server)
+        print("-" * 60)
+        return verify_local_variants(server) and cleanup_ok
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(0 if verify_image_fetch() else 1)
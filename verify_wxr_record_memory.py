@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+验证 wp2typecho 解析记录的内存占用
+生成一个评论很多的合成WXR导出文件，比较 __slots__ 记录（Post/Comment/Term）
+与以前的字典记录保存同样数据时的内存
+"""
+
+import gc
+import os
+import sys
+import tempfile
+import tracemalloc
+
+from wp2typecho import WP2Typecho
+
+# 记录内存至少要比字典少这个比例
+MIN_REDUCTION = 0.25
+
+WXR_HEADER = '''<?xml version="1.0" encoding="UTF-8" ?>
+<rss version="2.0" xmlns:excerpt="http://wordpress.org/export/1.2/excerpt/"
+ xmlns:content="http://purl.org/rss/1.0/modules/content/" xmlns:wfw="http://wellformedweb.org/CommentAPI/"
+ xmlns:dc="http://purl.org/dc/elements/1.1/" xmlns:wp="http://wordpress.org/export/1.2/">
+<channel>
+<title>Synthetic</title>
+'''
+
+
+def build_export(path, posts, comments_per_post):
+    """生成合成WXR：20个分类、50个标签，每篇文章若干条评论"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(WXR_HEADER)
+        for i in range(20):
+            f.write(f'<wp:category><wp:category_nicename>cat-{i}</wp:category_nicename>'
+                    f'<wp:category_parent></wp:category_parent><wp:cat_name>分类{i}</wp:cat_name></wp:category>\n')
+        for i in range(50):
+            f.write(f'<wp:tag><wp:tag_slug>tag-{i}</wp:tag_slug><wp:tag_name>标签{i}</wp:tag_name></wp:tag>\n')
+
+        comment_id = 1
+        for i in range(posts):
+            f.write(f'<item><title>文章 {i}</title>'
+                    f'<content:encoded><![CDATA[<p>正文 {i}</p>]]></content:encoded>'
+                    f'<wp:post_id>{i + 1}</wp:post_id><wp:post_date>2024-01-01 12:00:00</wp:post_date>'
+                    f'<wp:post_name>post-{i}</wp:post_name><wp:status>publish</wp:status>'
+                    f'<wp:post_type>post</wp:post_type>'
+                    f'<category domain="category" nicename="cat-{i % 20}">c</category>'
+                    f'<category domain="post_tag" nicename="tag-{i % 50}">t</category>\n')
+            for j in range(comments_per_post):
+                f.write(f'<wp:comment><wp:comment_id>{comment_id}</wp:comment_id>'
+                        f'<wp:comment_author>user{j % 100}</wp:comment_author>'
+                        f'<wp:comment_author_email>user{j % 100}@example.com</wp:comment_author_email>'
+                        f'<wp:comment_author_url></wp:comment_author_url>'
+                        f'<wp:comment_author_IP>10.0.0.{j % 250}</wp:comment_author_IP>'
+                        f'<wp:comment_date>2024-01-02 08:00:00</wp:comment_date>'
+                        f'<wp:comment_content>评论 {comment_id}</wp:comment_content>'
+                        f'<wp:comment_approved>1</wp:comment_approved>'
+                        f'<wp:comment_parent>0</wp:comment_parent></wp:comment>\n')
+                comment_id += 1
+            f.write('</item>\n')
+        f.write('</channel>\n</rss>\n')
+
+
+def _fresh(text):
+    """复制出一个新的字符串对象，模拟解析器为每个元素生成的字符串"""
+    return (text + '.')[:-1] if text else text
+
+
+def as_dicts(records):
+    """转换为以前解析器生成的字典记录"""
+    result = []
+    for kind, data in records:
+        if kind != 'post':
+            result.append((kind, {'slug': _fresh(data.slug), 'name': _fresh(data.name),
+                                  'parent': _fresh(data.parent)}))
+            continue
+        result.append((kind, {
+            'title': _fresh(data.title),
+            'content': _fresh(data.content),
+            'slug': _fresh(data.slug),
+            'type': _fresh(data.type),
+            'status': data.status,
+            'date': _fresh(data.date),
+            'categories': [_fresh(slug) for slug in data.categories],
+            'tags': [_fresh(slug) for slug in data.tags],
+            'comments': [{
+                'comment_id': str(comment.comment_id),
+                'author': _fresh(comment.author),
+                'email': _fresh(comment.email),
+                'url': _fresh(comment.url),
+                'ip': _fresh(comment.ip),
+                'date': _fresh(comment.date),
+                'content': _fresh(comment.content),
+                'approved': comment.approved,
+                'parent': str(comment.parent),
+            } for comment in data.comments],
+        }))
+    return result
+
+
+def traced_size(build):
+    """返回 build() 结果在内存中的占用（字节）"""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = build()
+        gc.collect()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, size
+
+
+def verify_record_memory(posts=1000, comments_per_post=50):
+    """解析合成导出文件并比较两种记录的内存"""
+    with tempfile.TemporaryDirectory() as tmp:
+        wxr_file = os.path.join(tmp, 'synthetic.xml')
+        build_export(wxr_file, posts, comments_per_post)
+
+        converter = WP2Typecho(wxr_file)
+        records, record_size = traced_size(lambda: list(converter.parse_wxr()))
+
+    # 字典记录使用各自的字符串副本，与记录不共享内存
+    dicts, dict_size = traced_size(lambda: as_dicts(records))
+    del dicts
+
+    reduction = 1 - record_size / dict_size
+
+    print("=" * 60)
+    print("WXR解析记录内存验证")
+    print("=" * 60)
+    print(f"文章: {posts} 篇，评论: {posts * comments_per_post} 条")
+    print(f"字典记录:      {dict_size / 1024 / 1024:>8.1f} MB")
+    print(f"__slots__记录: {record_size / 1024 / 1024:>8.1f} MB")
+    print(f"减少:          {reduction:>8.1%}")
+    print("-" * 60)
+
+    if reduction < MIN_REDUCTION:
+        print(f"✗ 内存减少不足 {MIN_REDUCTION:.0%}")
+        return False
+    print(f"✓ __slots__记录比字典记录节省 {reduction:.0%} 内存")
+    return True
+
+
+if __name__ == "__main__":
+    sys.exit(0 if verify_record_memory() else 1)